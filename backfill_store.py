@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import time
+
+STATUS_PENDING = "pending"      # Found in history, not described yet
+STATUS_DESCRIBED = "described"  # Description stored, not posted yet
+STATUS_POSTED = "posted"        # Reply posted; counts as cached from now on
+STATUS_FAILED = "failed"        # Retried on the next run
+STATUS_SKIPPED = "skipped"      # Can never succeed (e.g. the message was deleted); not retried
+
+
+class BackfillStore:
+    """Checkpoints for bulk channel descriptions, kept in SQLite.
+
+    Every image found in a channel's history is one row, so an interrupted
+    backfill picks up where it stopped: images already described are only
+    posted, and images already posted are skipped entirely.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "attachment_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+            "url TEXT NOT NULL, content_type TEXT NOT NULL, status TEXT NOT NULL, "
+            "file_uri TEXT, file_mime TEXT, uploaded_at REAL, model TEXT, description TEXT, error TEXT)"
+        )
+        # Databases created before uploads were timestamped lack this column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+        if "uploaded_at" not in columns:
+            self._conn.execute("ALTER TABLE items ADD COLUMN uploaded_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_channel ON items (channel_id, status, message_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "channel_id INTEGER PRIMARY KEY, batch_name TEXT NOT NULL, model TEXT NOT NULL, attachment_ids TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def save_items(self, items):
+        """Records images found in history. Each item is (attachment_id, channel_id, message_id, url, content_type).
+
+        Known images keep their status; only their URL is refreshed, since
+        Discord CDN links expire.
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO items (attachment_id, channel_id, message_id, url, content_type, status) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (attachment_id) DO UPDATE SET url = excluded.url",
+                [item + (STATUS_PENDING,) for item in items]
+            )
+
+    def items(self, channel_id: int, status: str):
+        """Returns rows as dicts, oldest message first."""
+        cursor = self._conn.execute(
+            "SELECT * FROM items WHERE channel_id = ? AND status = ? ORDER BY message_id, attachment_id",
+            (channel_id, status)
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def finished_ids(self, channel_id: int) -> set:
+        """Attachment IDs that need no more work: posted, or skipped for good."""
+        rows = self._conn.execute(
+            "SELECT attachment_id FROM items WHERE channel_id = ? AND status IN (?, ?)",
+            (channel_id, STATUS_POSTED, STATUS_SKIPPED)
+        )
+        return {row[0] for row in rows}
+
+    def counts(self, channel_id: int) -> dict:
+        rows = self._conn.execute(
+            "SELECT status, COUNT(*) FROM items WHERE channel_id = ? GROUP BY status", (channel_id,)
+        )
+        return dict(rows.fetchall())
+
+    def set_file(self, attachment_id: int, file_uri: str, file_mime: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET file_uri = ?, file_mime = ?, uploaded_at = ? WHERE attachment_id = ?",
+                (file_uri, file_mime, time.time(), attachment_id)
+            )
+
+    def set_described(self, attachment_id: int, model: str, description: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET status = ?, model = ?, description = ?, error = NULL WHERE attachment_id = ?",
+                (STATUS_DESCRIBED, model, description, attachment_id)
+            )
+
+    def set_failed(self, attachment_id: int, error: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET status = ?, error = ? WHERE attachment_id = ?",
+                (STATUS_FAILED, error[:500], attachment_id)
+            )
+
+    def set_skipped(self, attachment_id: int, error: str):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET status = ?, error = ? WHERE attachment_id = ?",
+                (STATUS_SKIPPED, error[:500], attachment_id)
+            )
+
+    def retry_failed(self, channel_id: int):
+        """Queues failed images again: ones with a description for posting, the rest for describing."""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET status = CASE WHEN description IS NULL THEN ? ELSE ? END "
+                "WHERE channel_id = ? AND status = ?",
+                (STATUS_PENDING, STATUS_DESCRIBED, channel_id, STATUS_FAILED)
+            )
+
+    def set_posted(self, attachment_id: int):
+        with self._conn:
+            self._conn.execute("UPDATE items SET status = ? WHERE attachment_id = ?", (STATUS_POSTED, attachment_id))
+
+    def get_batch(self, channel_id: int):
+        row = self._conn.execute(
+            "SELECT batch_name, model, attachment_ids FROM batches WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"batch_name": row[0], "model": row[1], "attachment_ids": json.loads(row[2])}
+
+    def set_batch(self, channel_id: int, batch_name: str, model: str, attachment_ids):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches (channel_id, batch_name, model, attachment_ids) VALUES (?, ?, ?, ?)",
+                (channel_id, batch_name, model, json.dumps(attachment_ids))
+            )
+
+    def clear_batch(self, channel_id: int):
+        with self._conn:
+            self._conn.execute("DELETE FROM batches WHERE channel_id = ?", (channel_id,))
@@ -1,5 +1,6 @@
 import discord
 from discord.ext import commands, tasks
+import pytesseract
 from google import genai
 import utils
 import os
@@ -297,6 +298,94 @@ class Admin(commands.Cog):
             from main import handle_error
             await handle_error(f"Failed to update prefix setting: {e}")
             
+    async def _parse_scoped_value(self, key: str, value: str):
+        """Validates a value for a scoped setting. Returns (value, error message)."""
+        if key == "rate_limit":
+            if not (value.isascii() and value.isdigit()):
+                return None, "The rate limit must be a whole number of image commands per user per minute (0 for unlimited)."
+            return int(value), None
+        if key == "prefix" and len(value) > 10:
+            return None, "Prefixes can be at most 10 characters long."
+        if key == "ocr_language":
+            # A bad language makes every Tesseract call in the scope fail, so only accept installed ones
+            try:
+                installed = set(await asyncio.to_thread(pytesseract.get_languages))
+            except Exception as e:
+                return None, f"Could not check the installed Tesseract languages: {e}"
+            requested = value.split("+")
+            missing = [lang for lang in requested if lang not in installed]
+            if missing:
+                available = ", ".join(f"`{lang}`" for lang in sorted(installed)) or "none"
+                return None, f"Tesseract language(s) not installed: {', '.join(missing)}. Installed languages: {available}. Combine several with `+`, e.g. `eng+deu`."
+        return value, None
+
+    async def _set_scoped(self, ctx: commands.Context, key: str, value: str, guild_id=None, channel_id=None, scope_name=""):
+        key = key.lower()
+        if key not in utils.SCOPED_SETTINGS:
+            await ctx.send(f"Unknown setting `{key}`. Available settings: {', '.join(f'`{k}`' for k in utils.SCOPED_SETTINGS)}.")
+            return
+
+        if value.lower() == "reset":
+            utils.clear_setting(key, guild_id=guild_id, channel_id=channel_id)
+            await ctx.send(f"`{key}` override removed for {scope_name}. It now uses `{utils.get_setting_for(ctx, key)}`.")
+            return
+
+        parsed, error = await self._parse_scoped_value(key, value)
+        if error:
+            await ctx.send(error)
+            return
+
+        try:
+            utils.update_setting(key, parsed, guild_id=guild_id, channel_id=channel_id)
+            await ctx.send(f"`{key}` set to `{parsed}` for {scope_name}.")
+        except Exception as e:
+            await ctx.send(f"Failed to update setting: {e}")
+            from main import handle_error
+            await handle_error(f"Failed to update scoped setting {key}: {e}")
+
+    @commands.command(name="serverset", description="Overrides a setting for this server (Manage Server).")
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def serverset(self, ctx: commands.Context, key: str, *, value: str):
+        """
+        Overrides a setting for the whole server. Use `reset` as the value to remove the override.
+        Settings: prefix, default_model, ocr_language, rate_limit
+        Usage: serverset <setting> <value|reset>
+        Example: serverset ocr_language deu
+        """
+        await self._set_scoped(ctx, key, value.strip(), guild_id=ctx.guild.id, scope_name="this server")
+
+    @commands.command(name="channelset", description="Overrides a setting for this channel (Manage Server).")
+    @commands.guild_only()
+    @commands.has_permissions(manage_guild=True)
+    async def channelset(self, ctx: commands.Context, key: str, *, value: str):
+        """
+        Overrides a setting for this channel only. Use `reset` as the value to remove the override.
+        Settings: prefix, default_model, ocr_language, rate_limit
+        Usage: channelset <setting> <value|reset>
+        Example: channelset rate_limit 5
+        """
+        _, channel_id = utils.scope_ids(ctx)
+        await self._set_scoped(ctx, key, value.strip(), channel_id=channel_id, scope_name="this channel")
+
+    @commands.command(name="settings", description="Shows the settings that apply in this channel.")
+    async def settings(self, ctx: commands.Context):
+        guild_id, channel_id = utils.scope_ids(ctx)
+        store = utils.get_store()
+        guild_overrides = store.overrides(utils.SCOPE_GUILD, guild_id) if guild_id else {}
+        channel_overrides = store.overrides(utils.SCOPE_CHANNEL, channel_id) if channel_id else {}
+
+        lines = ["**Settings for this channel:**"]
+        for key in utils.SCOPED_SETTINGS:
+            if key in channel_overrides:
+                source = "channel"
+            elif key in guild_overrides:
+                source = "server"
+            else:
+                source = "global"
+            lines.append(f"{key}: `{utils.get_setting_for(ctx, key)}` ({source})")
+        await ctx.send("\n".join(lines))
+
     @commands.command(name="errorlogs", description="Shows the last 20 lines of the console error log (Owner Only).")
     @commands.is_owner()
     async def errorlogs(self, ctx: commands.Context):
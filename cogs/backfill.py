@@ -0,0 +1,360 @@
+import discord
+from discord.ext import commands
+from google.genai import types, errors
+import asyncio
+import datetime
+import io
+import time
+import utils
+from backfill_store import BackfillStore, STATUS_PENDING, STATUS_DESCRIBED, STATUS_POSTED, STATUS_FAILED, STATUS_SKIPPED
+from memory_budget import MemoryBudgetExceeded
+from cogs.gemini import DESCRIBE_PROMPT
+
+BACKFILL_DB = "backfill.db"
+DEFAULT_HISTORY_LIMIT = 200
+MAX_HISTORY_LIMIT = 5000
+MAX_IMAGES_PER_RUN = 500
+# Parallel downloads/uploads, and Gemini calls when the batch API isn't available
+CONCURRENCY = 4
+MAX_RETRIES = 3
+BATCH_POLL_SECONDS = 30
+PROGRESS_EDIT_SECONDS = 10
+# Gap between description replies, to stay well inside Discord's rate limits
+POST_INTERVAL_SECONDS = 2
+# Files API uploads expire after 48 hours; upload again well before that
+FILE_REUSE_SECONDS = 40 * 60 * 60
+# Discord error code for replying to a message that no longer exists
+UNKNOWN_MESSAGE = 10008
+# Gemini errors caused by the key, project or model rather than the image; every
+# other image would fail the same way, so the run stops instead
+FATAL_API_CODES = {401, 403, 404}
+# Gemini errors caused by the image itself (bad or unsupported data)
+IMAGE_API_STATUSES = {"INVALID_ARGUMENT", "FAILED_PRECONDITION"}
+IMAGE_API_CODES = {413, 415}
+
+BATCH_SUCCEEDED = {types.JobState.JOB_STATE_SUCCEEDED, types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED}
+BATCH_FINISHED = BATCH_SUCCEEDED | {
+    types.JobState.JOB_STATE_FAILED,
+    types.JobState.JOB_STATE_CANCELLED,
+    types.JobState.JOB_STATE_EXPIRED,
+}
+
+
+def is_fatal_api_error(e: errors.APIError) -> bool:
+    if e.code in FATAL_API_CODES:
+        return True
+    # An invalid key comes back as 400 INVALID_ARGUMENT, like a bad image
+    return e.code == 400 and ("API_KEY" in str(e.details) or "API key" in (e.message or ""))
+
+def is_image_api_error(e: errors.APIError) -> bool:
+    return not is_fatal_api_error(e) and (e.code in IMAGE_API_CODES or e.status in IMAGE_API_STATUSES)
+
+
+class Progress:
+    """Edits one status message, at most every PROGRESS_EDIT_SECONDS."""
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.last_edit = 0
+
+    async def update(self, text: str, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_edit < PROGRESS_EDIT_SECONDS:
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit(content=text)
+        except discord.HTTPException:
+            pass
+
+
+class Backfill(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.store = BackfillStore(BACKFILL_DB)
+        self.running = set()    # Channel IDs with a backfill in progress
+        self.cancelled = set()  # Channel IDs asked to stop
+
+    @staticmethod
+    def _parse_bound(bound: str):
+        """Returns (history limit, after date) from a message count or a YYYY-MM-DD date."""
+        if bound is None:
+            return DEFAULT_HISTORY_LIMIT, None
+        if bound.isdigit():
+            return min(int(bound), MAX_HISTORY_LIMIT), None
+        after = datetime.datetime.strptime(bound, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+        return MAX_HISTORY_LIMIT, after
+
+    async def _download(self, url: str):
+        """Downloads an attachment under the memory budget. Returns (lease, bytes)."""
+        async with self.bot.http_session.get(url) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Download failed with status {resp.status}")
+            return await self.bot.memory_governor.read_response(resp)
+
+    async def _collect(self, channel: discord.TextChannel, limit: int, after):
+        """Walks the channel history and checkpoints image attachments that still need work.
+
+        Images already posted or skipped don't count toward MAX_IMAGES_PER_RUN, so
+        each run gets further into a long history instead of rescanning the same ones.
+        Returns the number of images saved.
+        """
+        finished = self.store.finished_ids(channel.id)
+        found = []
+        async for message in channel.history(limit=limit, after=after):
+            if message.author == self.bot.user:
+                continue
+            for attachment in message.attachments:
+                if attachment.id in finished or not (attachment.content_type or "").startswith('image/'):
+                    continue
+                found.append((attachment.id, channel.id, message.id, attachment.url, attachment.content_type))
+            if len(found) >= MAX_IMAGES_PER_RUN:
+                break
+        found = found[:MAX_IMAGES_PER_RUN]
+        self.store.save_items(found)
+        return len(found)
+
+    def _status_text(self, channel: discord.TextChannel, phase: str) -> str:
+        counts = self.store.counts(channel.id)
+        return (
+            f"**Backfill for {channel.mention}:** {phase}\n"
+            f"Pending: `{counts.get(STATUS_PENDING, 0)}`, described: `{counts.get(STATUS_DESCRIBED, 0)}`, "
+            f"posted: `{counts.get(STATUS_POSTED, 0)}`, failed: `{counts.get(STATUS_FAILED, 0)}`, "
+            f"skipped: `{counts.get(STATUS_SKIPPED, 0)}`"
+        )
+
+    async def _submit_batch(self, channel, gemini, model: str, pending, progress: Progress):
+        """Uploads pending images and submits them as one Gemini batch job.
+
+        Returns the checkpointed batch, or None if nothing could be submitted.
+        """
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def upload(item):
+            if item["file_uri"] and time.time() - (item["uploaded_at"] or 0) < FILE_REUSE_SECONDS:
+                return
+            # Missing or about to expire; a stale URI must not go into the batch
+            item["file_uri"] = None
+            async with semaphore:
+                try:
+                    lease, data = await self._download(item["url"])
+                    with lease:
+                        uploaded = await asyncio.to_thread(
+                            gemini.client.files.upload,
+                            file=io.BytesIO(data),
+                            config=types.UploadFileConfig(mime_type=item["content_type"])
+                        )
+                    self.store.set_file(item["attachment_id"], uploaded.uri, uploaded.mime_type)
+                    item["file_uri"], item["file_mime"] = uploaded.uri, uploaded.mime_type
+                except MemoryBudgetExceeded as e:
+                    self.store.set_skipped(item["attachment_id"], str(e))
+                except Exception as e:
+                    # Left pending; the concurrent pipeline picks it up afterwards
+                    print(f"[Backfill] Upload failed for attachment {item['attachment_id']}: {e}")
+            await progress.update(self._status_text(channel, "uploading images for the batch job..."))
+
+        await asyncio.gather(*(upload(item) for item in pending))
+        ready = [item for item in pending if item["file_uri"]]
+        if not ready or channel.id in self.cancelled:
+            return None
+
+        requests = [
+            types.InlinedRequest(
+                contents=[types.Content(role="user", parts=[
+                    types.Part.from_uri(file_uri=item["file_uri"], mime_type=item["file_mime"]),
+                    types.Part.from_text(text=DESCRIBE_PROMPT)
+                ])],
+                metadata={"attachment_id": str(item["attachment_id"])}
+            )
+            for item in ready
+        ]
+        try:
+            job = await asyncio.to_thread(
+                gemini.client.batches.create,
+                model=model,
+                src=requests,
+                config=types.CreateBatchJobConfig(display_name=f"backfill-{channel.id}")
+            )
+        except Exception as e:
+            print(f"[Backfill] Batch API unavailable, falling back to concurrent requests: {e}")
+            return None
+
+        attachment_ids = [item["attachment_id"] for item in ready]
+        self.store.set_batch(channel.id, job.name, model, attachment_ids)
+        return self.store.get_batch(channel.id)
+
+    async def _wait_for_batch(self, channel, gemini, batch, progress: Progress):
+        """Polls a batch job and stores its descriptions. Returns False if stopped before it finished."""
+        while True:
+            if channel.id in self.cancelled:
+                return False
+            job = await asyncio.to_thread(gemini.client.batches.get, name=batch["batch_name"])
+            if job.state in BATCH_FINISHED:
+                break
+            state = job.state.name.replace("JOB_STATE_", "").lower() if job.state else "unknown"
+            await progress.update(self._status_text(channel, f"batch job `{batch['batch_name']}` is {state}..."))
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+
+        if job.state in BATCH_SUCCEEDED and job.dest and job.dest.inlined_responses:
+            for index, result in enumerate(job.dest.inlined_responses):
+                if result.metadata and "attachment_id" in result.metadata:
+                    attachment_id = int(result.metadata["attachment_id"])
+                elif index < len(batch["attachment_ids"]):
+                    # Responses come back in request order
+                    attachment_id = batch["attachment_ids"][index]
+                else:
+                    continue
+                text = result.response.text if result.response else None
+                if text:
+                    self.store.set_described(attachment_id, batch["model"], text)
+                else:
+                    self.store.set_failed(attachment_id, str(result.error or "Empty response"))
+        else:
+            # Anything not described stays pending for the concurrent pipeline
+            print(f"[Backfill] Batch job {batch['batch_name']} ended as {job.state}.")
+
+        self.store.clear_batch(channel.id)
+        return True
+
+    async def _run_pipeline(self, channel, gemini, model: str, pending, progress: Progress):
+        """Describes images with concurrent Gemini calls, retrying on rate limits.
+
+        Raises RuntimeError if Gemini rejects the key or model, since no other image would succeed either.
+        """
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        fatal = []
+
+        async def describe_one(item):
+            async with semaphore:
+                if channel.id in self.cancelled or fatal:
+                    return
+                for attempt in range(MAX_RETRIES):
+                    try:
+                        lease, data = await self._download(item["url"])
+                        with lease:
+                            response = await gemini.client.aio.models.generate_content(
+                                model=model,
+                                contents=[DESCRIBE_PROMPT, types.Part.from_bytes(data=data, mime_type=item["content_type"])]
+                            )
+                        if response.text:
+                            self.store.set_described(item["attachment_id"], model, response.text)
+                        else:
+                            self.store.set_failed(item["attachment_id"], "Empty response")
+                        break
+                    except errors.APIError as e:
+                        if e.code == 429 and attempt < MAX_RETRIES - 1:
+                            await asyncio.sleep(5 * 2 ** attempt)
+                            continue
+                        if is_image_api_error(e):
+                            # Gemini rejected the image itself; retrying won't help
+                            self.store.set_skipped(item["attachment_id"], str(e))
+                        else:
+                            self.store.set_failed(item["attachment_id"], str(e))
+                            if is_fatal_api_error(e):
+                                fatal.append(e)
+                        break
+                    except MemoryBudgetExceeded as e:
+                        self.store.set_skipped(item["attachment_id"], str(e))
+                        break
+                    except Exception as e:
+                        self.store.set_failed(item["attachment_id"], str(e))
+                        break
+            await progress.update(self._status_text(channel, "describing images..."))
+
+        await asyncio.gather(*(describe_one(item) for item in pending))
+        if fatal:
+            raise RuntimeError(f"Gemini refused the request; check the API key and model `{model}`: {fatal[0]}")
+
+    async def _post_descriptions(self, channel, progress: Progress):
+        """Replies to each original message with its description, oldest first, at a steady pace."""
+        for item in self.store.items(channel.id, STATUS_DESCRIBED):
+            if channel.id in self.cancelled:
+                return
+            original = channel.get_partial_message(item["message_id"])
+            chunks = utils.split_message(f"**Image Description ({item['model']}):**\n{item['description']}")
+            try:
+                await original.reply(chunks[0], mention_author=False)
+                for chunk in chunks[1:]:
+                    await channel.send(chunk)
+                self.store.set_posted(item["attachment_id"])
+            except discord.HTTPException as e:
+                if isinstance(e, discord.NotFound) or e.code == UNKNOWN_MESSAGE:
+                    self.store.set_skipped(item["attachment_id"], "Original message was deleted")
+                else:
+                    self.store.set_failed(item["attachment_id"], f"Could not post: {e}")
+            await progress.update(self._status_text(channel, "posting descriptions..."))
+            await asyncio.sleep(POST_INTERVAL_SECONDS)
+
+    @commands.command(name="backfill", description="Describes images already posted in a channel (Owner Only).")
+    @commands.is_owner()
+    async def backfill(self, ctx: commands.Context, channel: discord.TextChannel, bound: str = None):
+        """
+        Describes image attachments already posted in a channel and replies to each one.
+        The bound is either a number of messages to scan (default 200) or a date (YYYY-MM-DD) to scan from.
+        Images that were already described are skipped, and running it again resumes an interrupted backfill.
+        Usage: backfill <#channel> [message_count|YYYY-MM-DD]
+        Example: backfill #photos 2026-01-01
+        """
+        gemini = self.bot.get_cog("GeminiCog")
+        if gemini is None or not gemini.client:
+            await ctx.send("The Gemini client is not initialized. Please check the console for errors.")
+            return
+
+        if channel.id in self.running:
+            await ctx.send(f"A backfill is already running for {channel.mention}.")
+            return
+
+        try:
+            limit, after = self._parse_bound(bound)
+        except ValueError:
+            await ctx.send("The bound must be a number of messages or a date in the form YYYY-MM-DD.")
+            return
+
+        model = utils.get_setting("default_model", channel.guild.id, channel.id) or gemini.model_name
+        self.running.add(channel.id)
+        self.cancelled.discard(channel.id)
+        progress = Progress(await ctx.send(f"**Backfill for {channel.mention}:** scanning history..."))
+
+        try:
+            # Failures from earlier runs get another go; permanent ones are marked skipped instead
+            self.store.retry_failed(channel.id)
+            found = await self._collect(channel, limit, after)
+            await progress.update(self._status_text(channel, f"queued {found} images from history that still need work."), force=True)
+
+            # Resume a batch job from an interrupted run, or submit a new one
+            batch = self.store.get_batch(channel.id)
+            if batch is None:
+                pending = self.store.items(channel.id, STATUS_PENDING)
+                if pending:
+                    batch = await self._submit_batch(channel, gemini, model, pending, progress)
+            if batch is not None:
+                await self._wait_for_batch(channel, gemini, batch, progress)
+
+            # Whatever the batch couldn't handle goes through the concurrent pipeline
+            pending = self.store.items(channel.id, STATUS_PENDING)
+            if pending and channel.id not in self.cancelled:
+                await self._run_pipeline(channel, gemini, model, pending, progress)
+
+            await self._post_descriptions(channel, progress)
+
+            phase = "stopped; run the command again to resume." if channel.id in self.cancelled else "done."
+            await progress.update(self._status_text(channel, phase), force=True)
+        except Exception as e:
+            await ctx.send(f"Backfill stopped because of an error; run the command again to resume: {e}")
+            from main import handle_error
+            await handle_error(f"Backfill failed for channel {channel.id}: {e}")
+        finally:
+            self.running.discard(channel.id)
+            self.cancelled.discard(channel.id)
+
+    @commands.command(name="backfillstop", description="Stops a running backfill; progress is kept (Owner Only).")
+    @commands.is_owner()
+    async def backfillstop(self, ctx: commands.Context, channel: discord.TextChannel):
+        if channel.id not in self.running:
+            await ctx.send(f"No backfill is running for {channel.mention}.")
+            return
+        self.cancelled.add(channel.id)
+        await ctx.send(f"Stopping the backfill for {channel.mention}. Run `{ctx.prefix}backfill` again to resume.")
+
+async def setup(bot):
+    await bot.add_cog(Backfill(bot))
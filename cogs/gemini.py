@@ -4,11 +4,14 @@ from google import genai
 from google.genai import types
 from PIL import Image
 import io
-import aiohttp
-from config import GEMINI_API_KEY
+import httpx
+from config import GEMINI_API_KEY, KEEPALIVE_SECONDS
 import asyncio
 import re
 import utils
+import routing
+from memory_budget import MemoryBudgetExceeded
+import frames
 
 # Helper function to send errors, defined outside the cog
 async def send_error_log(bot, error_message):
@@ -21,25 +24,130 @@ def truncate_message(message: str, max_length: int = 1900) -> str:
         return message[:max_length - 3] + "..."
     return message
 
+DESCRIBE_PROMPT = "Describe this image in detail for a blind user, focusing on the key objects, colors, and the overall scene."
+HYBRID_PROMPT = (
+    "Describe this image in detail for a blind user. It is mostly text. "
+    "The text below was read with OCR from a reduced grayscale copy, keeping only confidently recognised words, "
+    "so some text may be missing; the attached image is a reduced copy for layout and visual context. "
+    "Summarise the layout and any non-text content, then give the key text, correcting obvious OCR mistakes "
+    "and filling in what is legible in the image.\n\nOCR text:\n{text}"
+)
+OCR_ONLY_PROMPT = "Read the text in this image."
+FRAMES_PROMPT = (
+    "These are {count} key frames, in order, from an animation or short video. "
+    "Describe for a blind user what happens over time: the setting, who or what is moving, "
+    "and how the scene changes from start to end."
+)
+
+# Larger videos are rejected before download
+MAX_VIDEO_BYTES = 50 * 1024 * 1024
+
+# Follow-up sessions live this long after the last question before they are dropped.
+# Uploaded files expire on Google's side after 48 hours, so this must stay well below that.
+SESSION_TTL_SECONDS = 30 * 60
+MAX_SESSIONS = 500
+MAX_FOLLOWUP_TURNS = 10
+
+
+class ImageSession:
+    """What we keep about a described image so follow-up questions don't need a re-upload."""
+
+    def __init__(self, model_name, description, file=None, prompt=DESCRIBE_PROMPT):
+        self.model_name = model_name
+        self.file = file  # Gemini Files API handle, or None if the upload failed
+        self.turns = [(prompt, description)]
+
+    def build_contents(self, question: str):
+        """Builds the conversation history for a follow-up. Only the new question is new data."""
+        contents = []
+        for index, (prompt, answer) in enumerate(self.turns):
+            parts = [types.Part.from_text(text=prompt)]
+            if index == 0 and self.file is not None:
+                parts.insert(0, types.Part.from_uri(file_uri=self.file.uri, mime_type=self.file.mime_type))
+            contents.append(types.Content(role="user", parts=parts))
+            contents.append(types.Content(role="model", parts=[types.Part.from_text(text=answer)]))
+        if self.file is None:
+            question = f"(The image is no longer available; answer from the description above.) {question}"
+        contents.append(types.Content(role="user", parts=[types.Part.from_text(text=question)]))
+        return contents
+
+    def add_turn(self, question: str, answer: str):
+        self.turns.append((question, answer))
+        # Always keep the original description, trim the oldest follow-ups
+        if len(self.turns) > MAX_FOLLOWUP_TURNS + 1:
+            del self.turns[1]
+
 
 class GeminiCog(commands.Cog):
     def __init__(self, bot, client, model_name):
         self.bot = bot
         self.client = client
         self.model_name = model_name
+        # Keyed by the bot's description message IDs and by thread channel IDs
+        self.sessions = utils.TTLCache(max_size=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS, on_evict=self._on_session_evicted)
+
+    def _on_session_evicted(self, key, session):
+        """Deletes a session's uploaded file once no message or thread refers to the session any more."""
+        if session.file is None:
+            return
+        # One session is stored under every message of the reply, and under the thread
+        if any(value is session for value in self.sessions.values()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.run_in_executor(None, self._delete_file, session.file.name)
 
-    def _get_model_from_flags(self, flags: str) -> str:
+    def _delete_file(self, name: str):
+        try:
+            self.client.files.delete(name=name)
+        except Exception as e:
+            print(f"GeminiCog: Could not delete uploaded file {name}: {e}")
+
+    async def _upload_image(self, image_bytes: bytes, mime_type: str):
+        """Uploads the image to the Gemini Files API. Returns None if uploading isn't possible."""
+        try:
+            # The SDK call is blocking; keep it off the event loop
+            return await asyncio.to_thread(
+                self.client.files.upload,
+                file=io.BytesIO(image_bytes),
+                config=types.UploadFileConfig(mime_type=mime_type)
+            )
+        except Exception as e:
+            print(f"GeminiCog: File upload failed, sending image inline instead: {e}")
+            return None
+
+    def _remember_session(self, ctx: commands.Context, sent_messages, session: ImageSession):
+        for message in sent_messages:
+            self.sessions.set(message.id, session)
+        if isinstance(ctx.channel, discord.Thread):
+            self.sessions.set(ctx.channel.id, session)
+
+    def _find_session(self, ctx: commands.Context):
+        reference = ctx.message.reference
+        if reference and reference.message_id:
+            session = self.sessions.get(reference.message_id)
+            if session:
+                return session
+        if isinstance(ctx.channel, discord.Thread):
+            return self.sessions.get(ctx.channel.id)
+        return None
+
+    def _get_model_from_flags(self, ctx: commands.Context, flags: str) -> str:
         match = re.search(r"-m\s+([^\s]+)", flags)
         if match:
             return match.group(1)
-        return self.model_name
+        # Guild/channel default, falling back to the model chosen at startup
+        return utils.get_setting_for(ctx, "default_model") or self.model_name
 
     @commands.command(
         name="describe", 
         description="Describes an image using Gemini (defaults to gemini-3-flash-preview). Use -m to specify a model.", 
-        usage="[-m model]",
-        help="Describes an attached image. You can optionally specify which Gemini model to use by adding '-m model_name' to your message (e.g., `alii!describe -m gemini-3-flash-preview`)."
+        usage="[-m model] [--ocr | --full]",
+        help="Describes an attached image, animated GIF/WebP or short video. You can optionally specify which Gemini model to use by adding '-m model_name' to your message (e.g., `alii!describe -m gemini-3-flash-preview`). Images that are mostly text are read locally first and sent to Gemini as text plus a smaller image; add `--ocr` to get only the OCR text, or `--full` to always send the full image."
     )
+    @commands.before_invoke(utils.image_rate_limit)
     async def describe(self, ctx: commands.Context, *, flags: str = ""):
         if not self.client:
             await ctx.send("The Gemini client is not initialized. Please check the console for errors.")
@@ -50,44 +158,159 @@ class GeminiCog(commands.Cog):
             return
 
         attachment = ctx.message.attachments[0]
-        if not attachment.content_type.startswith('image/'):
-            await ctx.send("The attached file must be an image.")
+        content_type = attachment.content_type or ""
+        is_video = content_type.startswith('video/')
+        if not (content_type.startswith('image/') or is_video):
+            await ctx.send("The attached file must be an image or a short video.")
+            return
+        if is_video and frames.av is None:
+            await ctx.send("Describing videos requires the PyAV package. Ask the bot owner to run `pip install av`.")
+            return
+        if is_video and attachment.size > MAX_VIDEO_BYTES:
+            await ctx.send(f"That video is too large. Please attach one under {MAX_VIDEO_BYTES // (1024 * 1024)}MB.")
             return
 
-        target_model = self._get_model_from_flags(flags)
+        target_model = self._get_model_from_flags(ctx, flags)
+        # An upload that ends up in no session would otherwise linger on Google's side until it expires
+        uploaded_file = None
+        kept_upload = False
 
         async with ctx.typing():
             try:
-                # Fetch image from URL
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(attachment.url) as resp:
-                        if resp.status != 200:
-                            await ctx.send("Could not download image from Discord. The error has been logged.")
-                            await send_error_log(self.bot, f"Failed to download image from {attachment.url} with status {resp.status}")
+                # Fetch image from URL over the bot's shared, kept-alive session
+                async with self.bot.http_session.get(attachment.url) as resp:
+                    if resp.status != 200:
+                        await ctx.send("Could not download image from Discord. The error has been logged.")
+                        await send_error_log(self.bot, f"Failed to download image from {attachment.url} with status {resp.status}")
+                        return
+                    # Waits here if too much image data is already in memory
+                    lease, image_bytes = await self.bot.memory_governor.read_response(resp)
+
+                flag_words = flags.split()
+                with lease:
+                    img = None if is_video else Image.open(io.BytesIO(image_bytes))
+
+                    if is_video or frames.is_animated(img):
+                        # Only a bounded set of distinct, downscaled frames is decoded and sent
+                        key_frames, report = await asyncio.to_thread(frames.extract_key_frames, image_bytes, is_video)
+                        if not key_frames:
+                            await ctx.send("Could not read any frames from the attachment.")
                             return
-                        image_bytes = await resp.read()
+                        prompt = FRAMES_PROMPT.format(count=len(key_frames))
+                        contents = [prompt]
+                        for seconds, frame in key_frames:
+                            contents.append(f"Frame at {seconds:.1f}s:")
+                            contents.append(types.Part.from_bytes(data=frames.encode_frame(frame), mime_type="image/jpeg"))
+                        del key_frames
+                    else:
+                        if "--full" in flag_words:
+                            decision = routing.RouteDecision(routing.ROUTE_FULL, reason="requested with --full")
+                        else:
+                            # A quick local OCR pass decides how much of the image Gemini actually needs
+                            ocr_language = utils.get_setting_for(ctx, "ocr_language")
+                            decision = await asyncio.to_thread(routing.decide_route, img, "--ocr" in flag_words, ocr_language)
+                        report = decision.report()
 
-                # Prepare image for Gemini
-                img = Image.open(io.BytesIO(image_bytes))
+                        if "--ocr" in flag_words and decision.route != routing.ROUTE_OCR:
+                            await ctx.send(f"OCR isn't available right now ({decision.reason}), so I can't read the text on its own. Try again without `--ocr`.")
+                            return
 
-                # Send to Gemini
-                # The new SDK uses client.models.generate_content
-                response = self.client.models.generate_content(
-                    model=target_model,
-                    contents=["Describe this image in detail for a blind user, focusing on the key objects, colors, and the overall scene.", img]
-                )
+                        if decision.route == routing.ROUTE_OCR:
+                            if not decision.text.strip():
+                                await ctx.send("No text detected in the image.")
+                                return
+                            sent = await utils.send_long_message(ctx, f"**OCR Result:**\n```\n{decision.text}\n```\n{report}")
+                            self._remember_session(ctx, sent, ImageSession(target_model, decision.text, prompt=OCR_ONLY_PROMPT))
+                            return
+
+                        if decision.route == routing.ROUTE_HYBRID:
+                            upload_bytes = routing.shrink_for_hybrid(img)
+                            mime_type = "image/png"
+                            prompt = HYBRID_PROMPT.format(text=decision.text)
+                        else:
+                            upload_bytes = image_bytes
+                            mime_type = content_type
+                            prompt = DESCRIBE_PROMPT
+
+                        # Upload once so follow-up questions can refer to the same file
+                        uploaded_file = await self._upload_image(upload_bytes, mime_type)
+                        if uploaded_file is not None:
+                            image_part = uploaded_file
+                        else:
+                            image_part = Image.open(io.BytesIO(upload_bytes))
+                        contents = [prompt, image_part]
+                        del upload_bytes, image_part
+                    print(f"GeminiCog: {attachment.filename}: {report}")
+
+                    # Send to Gemini
+                    # The new SDK uses client.models.generate_content
+                    response = await asyncio.to_thread(
+                        self.client.models.generate_content,
+                        model=target_model,
+                        contents=contents
+                    )
+                    del image_bytes, img, contents
 
                 if response.text:
-                    await utils.send_long_message(ctx, f"**Image Description ({target_model}):**\n{response.text}")
+                    sent = await utils.send_long_message(ctx, f"**Image Description ({target_model}):**\n{response.text}\n\n{report}")
+                    self._remember_session(ctx, sent, ImageSession(target_model, response.text, uploaded_file, prompt=prompt))
+                    kept_upload = bool(sent)
                 else:
                     error_detail = "Gemini API returned no description."
                     await ctx.send(truncate_message(error_detail))
                     await send_error_log(self.bot, "Gemini API returned empty text.")
 
+            except MemoryBudgetExceeded as e:
+                await ctx.send(str(e))
             except Exception as e:
                 await ctx.send("An error occurred while describing the image. The error has been logged.")
                 await send_error_log(self.bot, f"Exception during image description: {e}")
+            finally:
+                if uploaded_file is not None and not kept_upload:
+                    await asyncio.to_thread(self._delete_file, uploaded_file.name)
     
+    @commands.command(
+        name="ask",
+        description="Asks a follow-up question about an image that was already described.",
+        usage="<question>",
+        help="Reply to one of the bot's image descriptions (or use it inside the thread where the image was described) to ask a follow-up question, e.g. `alii!ask what does the sign say?`. The image does not need to be attached again."
+    )
+    @commands.before_invoke(utils.image_rate_limit)
+    async def ask(self, ctx: commands.Context, *, question: str = ""):
+        if not self.client:
+            await ctx.send("The Gemini client is not initialized. Please check the console for errors.")
+            return
+
+        if not question.strip():
+            await ctx.send("Please include a question, for example: `ask what colour is the shirt?`")
+            return
+
+        session = self._find_session(ctx)
+        if session is None:
+            await ctx.send("I couldn't find a recent image description to follow up on. Reply to one of my descriptions, or use `describe` again.")
+            return
+
+        async with ctx.typing():
+            try:
+                response = await asyncio.to_thread(
+                    self.client.models.generate_content,
+                    model=session.model_name,
+                    contents=session.build_contents(question)
+                )
+
+                if response.text:
+                    session.add_turn(question, response.text)
+                    sent = await utils.send_long_message(ctx, f"**Answer ({session.model_name}):**\n{response.text}")
+                    # Replies to the answer continue the same conversation
+                    self._remember_session(ctx, sent, session)
+                else:
+                    await ctx.send(truncate_message("Gemini API returned no answer."))
+                    await send_error_log(self.bot, "Gemini API returned empty text for a follow-up question.")
+
+            except Exception as e:
+                await ctx.send("An error occurred while answering your question. The error has been logged.")
+                await send_error_log(self.bot, f"Exception during follow-up question: {e}")
+
     @commands.command(
         name="test", 
         description="Tests connection to Gemini (defaults to gemini-3-flash-preview). Use -m to specify a model.", 
@@ -99,7 +322,7 @@ class GeminiCog(commands.Cog):
             await ctx.send("The Gemini client is not initialized.")
             return
             
-        target_model = self._get_model_from_flags(flags)
+        target_model = self._get_model_from_flags(ctx, flags)
             
         await ctx.send(f"Testing connection to Gemini API with model: `{target_model}`")
         try:
@@ -122,7 +345,13 @@ async def setup(bot):
     
     print("GeminiCog setup: Starting initialization with new google-genai SDK.")
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
+        # Keep idle connections open long enough for the keepalive cog to reuse them
+        client = genai.Client(
+            api_key=GEMINI_API_KEY,
+            http_options=types.HttpOptions(client_args={"limits": httpx.Limits(
+                max_connections=100, max_keepalive_connections=20, keepalive_expiry=KEEPALIVE_SECONDS
+            )})
+        )
         print("GeminiCog setup: Client initialized.")
         
         # Simple test to check model availability is harder in new SDK without listing, 
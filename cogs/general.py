@@ -27,6 +27,11 @@ class General(commands.Cog):
             f"Command Response Latency: `{latency_command_response}ms`\n"
             f"Uptime: `{int(uptime_days)}d {int(uptime_hours)}h {int(uptime_minutes)}m {int(uptime_seconds)}s`"
         )
+        if hasattr(self.bot, 'memory_governor'):
+            status_message += f"\nImage Memory: `{self.bot.memory_governor.status()}`"
+        keepalive = self.bot.get_cog("KeepAlive")
+        if keepalive:
+            status_message += f"\n**Backend Latency:**\n{keepalive.report()}"
         await message.edit(content=status_message)
 
 
@@ -0,0 +1,118 @@
+import discord
+from discord.ext import commands, tasks
+from PIL import Image
+import pytesseract
+import asyncio
+import time
+import utils
+from config import KEEPALIVE_SECONDS
+
+# How often idle connections are exercised. Must stay below KEEPALIVE_SECONDS,
+# or the pools drop the connections in between.
+KEEPALIVE_INTERVAL_MINUTES = 4
+# A tick this soon after the last warm-up is skipped
+MIN_RUN_GAP_SECONDS = KEEPALIVE_INTERVAL_MINUTES * 60 / 2
+DISCORD_CDN_URL = "https://cdn.discordapp.com/"
+
+if KEEPALIVE_INTERVAL_MINUTES * 60 >= KEEPALIVE_SECONDS:
+    print("Warning: KEEPALIVE_SECONDS is shorter than the keepalive interval; idle connections will be dropped between pings.")
+
+
+class KeepAlive(commands.Cog):
+    """Warms up Gemini, the Discord CDN and Tesseract at startup and keeps them warm."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        # target -> {"cold": first measured ms, "warm": latest ms, "error": last error}
+        self.latencies = {}
+        self.last_run = 0
+        self.keepalive_task.start()
+        self.bot.loop.create_task(self.warm_up())
+
+    def cog_unload(self):
+        self.keepalive_task.cancel()
+
+    def _record(self, target: str, started: float, error: str = None):
+        entry = self.latencies.setdefault(target, {"cold": None, "warm": None, "error": None})
+        entry["error"] = error
+        if error:
+            return
+        elapsed = round((time.perf_counter() - started) * 1000)
+        if entry["cold"] is None:
+            entry["cold"] = elapsed
+        else:
+            entry["warm"] = elapsed
+
+    async def _ping_gemini(self):
+        gemini = self.bot.get_cog("GeminiCog")
+        if gemini is None or not gemini.client:
+            return
+        started = time.perf_counter()
+        try:
+            # A metadata lookup is enough to open (or reuse) the pooled TLS connection
+            await asyncio.to_thread(gemini.client.models.get, model=gemini.model_name)
+            self._record("Gemini API", started)
+        except Exception as e:
+            self._record("Gemini API", started, str(e))
+
+    async def _ping_cdn(self):
+        started = time.perf_counter()
+        try:
+            # Any status is fine; only the pooled connection matters
+            async with self.bot.http_session.head(DISCORD_CDN_URL):
+                pass
+            self._record("Discord CDN", started)
+        except Exception as e:
+            self._record("Discord CDN", started, str(e))
+
+    def _run_tesseract(self, lang: str):
+        # Tesseract runs as a new process each time, so this keeps its binary and
+        # language data in the OS file cache rather than resident in the bot
+        pytesseract.image_to_string(Image.new("L", (64, 32), 255), lang=lang)
+
+    async def _ping_tesseract(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._run_tesseract, utils.get_setting("ocr_language"))
+            self._record("Tesseract", started)
+        except pytesseract.TesseractNotFoundError:
+            self._record("Tesseract", started, "not installed")
+        except Exception as e:
+            self._record("Tesseract", started, str(e))
+
+    async def warm_up(self):
+        """Touches every backend once. Runs at startup and on every keepalive tick."""
+        self.last_run = time.monotonic()
+        await asyncio.gather(self._ping_gemini(), self._ping_cdn(), self._ping_tesseract())
+        print(f"[KeepAlive] {self.report().replace(chr(10), '; ')}")
+
+    def report(self) -> str:
+        """Cold (first) versus warm (latest) latency per backend, for `ping`."""
+        if not self.latencies:
+            return "Warm-up has not finished yet."
+        lines = []
+        for target, entry in self.latencies.items():
+            if entry["error"]:
+                lines.append(f"{target}: unavailable ({entry['error'][:80]})")
+                continue
+            cold = f"{entry['cold']}ms" if entry["cold"] is not None else "n/a"
+            warm = f"{entry['warm']}ms" if entry["warm"] is not None else "pending"
+            lines.append(f"{target}: cold `{cold}`, warm `{warm}`")
+        return "\n".join(lines)
+
+    @tasks.loop(minutes=KEEPALIVE_INTERVAL_MINUTES)
+    async def keepalive_task(self):
+        # The loop's first tick lands right after the startup warm-up; skip it
+        if time.monotonic() - self.last_run < MIN_RUN_GAP_SECONDS:
+            return
+        try:
+            await self.warm_up()
+        except Exception as e:
+            print(f"[KeepAlive] Failed: {e}")
+
+    @keepalive_task.before_loop
+    async def before_keepalive_task(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot):
+    await bot.add_cog(KeepAlive(bot))
@@ -1,17 +1,34 @@
 import discord
 from discord.ext import commands
-from PIL import Image
+from PIL import Image, ImageSequence
 import pytesseract
 import io
-import aiohttp
+import asyncio
 import logging
 import os
 import platform
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import utils
+import frames
+from memory_budget import bytes_per_pixel, MemoryBudgetExceeded
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Tesseract runs as a subprocess, so threads are enough to recognise pages in parallel
+OCR_WORKERS = min(4, os.cpu_count() or 1)
+# Upper bound on pages/frames read from a single document
+MAX_PAGES = 50
+# Upper bound on Tesseract passes for one animation; longer ones are sampled evenly
+MAX_OCR_FRAMES = 50
+PDF_RENDER_DPI = 200
+
 # Attempt to locate Tesseract on Windows if not in PATH
 if platform.system() == "Windows":
     # Common default installation paths
@@ -37,11 +54,161 @@ if platform.system() == "Windows":
     if not found_tesseract:
         logger.warning("Tesseract executable not found in standard Windows paths. Ensure it is in your PATH.")
 
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
+
+def page_info(data: bytes, max_pages: int = MAX_PAGES):
+    """Returns (page count, heading label, decoded bytes per page) without decoding any pages.
+
+    Pages are sized as the RGB images `iter_pages` yields, so a bilevel or
+    grayscale scan counts at 4 bytes per pixel rather than its stored mode.
+    """
+    rgb_bytes = bytes_per_pixel("RGB")
+    if is_pdf(data):
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            scale = PDF_RENDER_DPI / 72
+            # Pages can differ in size; budget for the largest one that will be rendered
+            largest = max(
+                (int(page.rect.width * scale) * int(page.rect.height * scale)
+                 for page in doc.pages(0, min(doc.page_count, max_pages))),
+                default=0
+            )
+            return doc.page_count, "Page", largest * rgb_bytes
+    with Image.open(io.BytesIO(data)) as img:
+        # Multi-page TIFFs are documents; GIF/WebP/APNG frames are animation frames
+        label = "Page" if img.format == "TIFF" else "Frame"
+        width, height = img.size
+        return getattr(img, "n_frames", 1), label, width * height * rgb_bytes
+
+def iter_pages(data: bytes, step: int = 1):
+    """Lazily yields one decoded page or frame at a time as an RGB PIL image.
+
+    PDFs are rendered page by page; multi-frame TIFFs and animated images are
+    seeked frame by frame, so only the current page is ever held decoded.
+    With `step` above 1, only every step-th page is converted and yielded.
+    """
+    if is_pdf(data):
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            for page in doc.pages(0, doc.page_count, step):
+                pix = page.get_pixmap(dpi=PDF_RENDER_DPI)
+                yield Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        return
+
+    with Image.open(io.BytesIO(data)) as img:
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            if index % step == 0:
+                yield frame.convert("RGB")
+
+def next_hashed_frame(frame_iter):
+    """Returns (frame, dhash) for the next frame, or None once the iterator is done. Runs in an executor."""
+    frame = next(frame_iter, None)
+    if frame is None:
+        return None
+    return frame, frames.dhash(frame)
+
 class OCR(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.executor = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix="ocr")
+
+    def cog_unload(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def ocr_animation(self, ctx: commands.Context, data: bytes, total_frames: int, lang: str = None):
+        """Reads an animated image and posts one merged result.
+
+        At most MAX_OCR_FRAMES evenly spaced frames are read. Frames that look the
+        same as the last one read are skipped, and text that repeats the previous
+        frame's is left out, so a captioned GIF reads once.
+        """
+        loop = asyncio.get_running_loop()
+        step = -(-total_frames // MAX_OCR_FRAMES)
+        frame_iter = iter_pages(data, step)
+        texts = []
+        batch = []
+        last_hash = None
+
+        async def flush():
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self.executor, pytesseract.image_to_string, frame, lang) for frame in batch
+            ))
+            batch.clear()
+            for text in results:
+                normalized = " ".join(text.split())
+                if normalized and (not texts or normalized != " ".join(texts[-1].split())):
+                    texts.append(text.strip())
+
+        try:
+            for _ in range(-(-total_frames // step)):
+                hashed = await loop.run_in_executor(None, next_hashed_frame, frame_iter)
+                if hashed is None:
+                    break
+                frame, frame_hash = hashed
+                if last_hash is not None and frames.hamming(frame_hash, last_hash) <= frames.DUPLICATE_DISTANCE:
+                    continue
+                last_hash = frame_hash
+                batch.append(frame)
+                if len(batch) >= OCR_WORKERS:
+                    await flush()
+            if batch:
+                await flush()
+        finally:
+            frame_iter.close()
+
+        if not texts:
+            await ctx.send("No text detected in the image.")
+            return
+        await utils.send_long_message(ctx, "**OCR Result:**\n```\n" + "\n\n".join(texts) + "\n```")
 
-    @commands.command(name="ocr", description="Performs OCR on an attached image or URL to extract text.")
+    async def stream_ocr(self, ctx: commands.Context, data: bytes, total_pages: int, label: str, lang: str = None):
+        """Recognises pages in parallel and posts each one, in order, as soon as it is ready."""
+        loop = asyncio.get_running_loop()
+        pages = iter_pages(data)
+        # A small window of in-flight pages keeps every worker busy without decoding the whole document
+        window = OCR_WORKERS * 2
+        pending = deque()
+        page_number = 0
+        found_text = False
+
+        async def submit_next():
+            nonlocal page_number
+            if page_number >= total_pages:
+                return False
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                return False
+            page_number += 1
+            pending.append((page_number, loop.run_in_executor(self.executor, pytesseract.image_to_string, page, lang)))
+            return True
+
+        try:
+            while len(pending) < window and await submit_next():
+                pass
+
+            while pending:
+                number, future = pending.popleft()
+                text = await future
+                await submit_next()
+
+                if text.strip():
+                    found_text = True
+                    await utils.send_long_message(ctx, f"**{label} {number} of {total_pages}:**\n```\n{text}\n```")
+                else:
+                    await ctx.send(f"**{label} {number} of {total_pages}:** No text detected.")
+        finally:
+            for _, future in pending:
+                future.cancel()
+            try:
+                pages.close()
+            except ValueError:
+                # Still decoding in the background; it is released once that finishes
+                pass
+
+        if not found_text:
+            await ctx.send("No text detected in the document.")
+
+    @commands.command(name="ocr", description="Performs OCR on an attached image, PDF or multi-page TIFF (or a URL) to extract text.")
+    @commands.before_invoke(utils.image_rate_limit)
     async def ocr(self, ctx: commands.Context, image_url: str = None):
         target_url = None
         if ctx.message.attachments:
@@ -55,17 +222,40 @@ class OCR(commands.Cog):
         async with ctx.typing():
             try:
                 # Fetch image from URL
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(target_url) as resp:
-                        if resp.status != 200:
-                            await ctx.send(f"Could not download image. Status: {resp.status}")
-                            return
-                        image_bytes = await resp.read()
+                async with self.bot.http_session.get(target_url) as resp:
+                    if resp.status != 200:
+                        await ctx.send(f"Could not download image. Status: {resp.status}")
+                        return
+                    # Waits here if too much image data is already in memory
+                    lease, image_bytes = await self.bot.memory_governor.read_response(resp)
 
                 # Process image with Tesseract
                 try:
+                    if is_pdf(image_bytes) and pymupdf is None:
+                        await ctx.send("Reading PDFs requires the PyMuPDF package. Ask the bot owner to run `pip install pymupdf`.")
+                        return
+
+                    lang = utils.get_setting_for(ctx, "ocr_language")
+                    total_pages, label, page_bytes = page_info(image_bytes)
+                    if label == "Frame" and total_pages > 1:
+                        # Animations are read as one image rather than posted frame by frame
+                        lease.grow(page_bytes * (OCR_WORKERS + 1) - lease.frame_bytes * 2)
+                        await self.ocr_animation(ctx, image_bytes, min(total_pages, frames.MAX_SCANNED_FRAMES), lang)
+                        return
+
+                    if total_pages > MAX_PAGES:
+                        await ctx.send(f"This document has {total_pages} pages; only the first {MAX_PAGES} will be read.")
+                        total_pages = MAX_PAGES
+
+                    if total_pages > 1 or is_pdf(image_bytes):
+                        # Account for every page the stream can hold decoded at once
+                        pages_in_memory = min(OCR_WORKERS * 2, total_pages) + 1
+                        lease.grow(page_bytes * pages_in_memory - lease.frame_bytes * 2)
+                        await self.stream_ocr(ctx, image_bytes, total_pages, label, lang)
+                        return
+
                     img = Image.open(io.BytesIO(image_bytes))
-                    text = pytesseract.image_to_string(img)
+                    text = await asyncio.get_running_loop().run_in_executor(self.executor, pytesseract.image_to_string, img, lang)
                     
                     if not text.strip():
                         await ctx.send("No text detected in the image.")
@@ -86,7 +276,11 @@ class OCR(commands.Cog):
                 except Exception as e:
                     await ctx.send(f"An error occurred during OCR processing: {e}")
                     logger.error(f"OCR Error: {e}")
+                finally:
+                    lease.release()
 
+            except MemoryBudgetExceeded as e:
+                await ctx.send(str(e))
             except Exception as e:
                 await ctx.send(f"Failed to process request: {e}")
                 logger.error(f"OCR Request Error: {e}")
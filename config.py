@@ -27,5 +27,18 @@ if not OWNER_IDS:
     print("Warning: OWNER_ID not found or invalid in .env. Owner commands will not work.")
 
 
+# Upper bound on image bytes (downloads plus decoded pixels) held in memory at once
+try:
+    MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "512"))
+except ValueError:
+    print("Warning: MEMORY_BUDGET_MB in .env is not a valid integer. Using 512.")
+    MEMORY_BUDGET_MB = 512
+
+
+# Idle HTTP connections (Discord CDN and Gemini) are kept open this long;
+# the keepalive cog pings more often than this
+KEEPALIVE_SECONDS = 300
+
+
 ERROR_LOG_CHANNEL_ID = None
 ERROR_LOG_DM = False
\ No newline at end of file
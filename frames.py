@@ -0,0 +1,145 @@
+import io
+from PIL import Image, ImageSequence
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# Frames considered per clip. Long clips are sampled evenly, so decode cost stays
+# roughly constant however long the clip is.
+CANDIDATE_FRAMES = 24
+# Most frames sent to Gemini in one request
+MAX_KEY_FRAMES = 8
+# Animated images are seeked frame by frame, so stop scanning after this many
+MAX_SCANNED_FRAMES = 1000
+# Frames decoded after a video seek while looking for the target timestamp
+MAX_DECODE_PER_SEEK = 120
+# Difference-hash distance (out of 64 bits) below which two frames count as the same shot
+DUPLICATE_DISTANCE = 6
+KEY_FRAME_MAX_SIDE = 512
+KEY_FRAME_JPEG_QUALITY = 80
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _shrink(img: Image.Image) -> Image.Image:
+    frame = img.convert("RGB")
+    frame.thumbnail((KEY_FRAME_MAX_SIDE, KEY_FRAME_MAX_SIDE))
+    return frame
+
+def is_animated(img: Image.Image) -> bool:
+    return getattr(img, "is_animated", False) and getattr(img, "n_frames", 1) > 1
+
+
+def iter_image_frames(img: Image.Image):
+    """Lazily yields (seconds, frame) for evenly spaced frames of an animated image."""
+    total = min(getattr(img, "n_frames", 1), MAX_SCANNED_FRAMES)
+    step = max(1, -(-total // CANDIDATE_FRAMES))
+    elapsed_ms = 0
+    for index, frame in enumerate(ImageSequence.Iterator(img)):
+        if index >= total:
+            break
+        if index % step == 0:
+            yield elapsed_ms / 1000, _shrink(frame)
+        elapsed_ms += frame.info.get("duration", 0) or 0
+
+def iter_video_frames(data: bytes):
+    """Lazily yields (seconds, frame) for evenly spaced timestamps of a video.
+
+    Seeks to each timestamp instead of decoding the whole clip, so only a
+    bounded number of frames is decoded per candidate.
+    """
+    with av.open(io.BytesIO(data)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if stream.duration and stream.time_base:
+            duration = float(stream.duration * stream.time_base)
+        elif container.duration:
+            duration = container.duration / av.time_base
+        else:
+            duration = 0
+
+        if duration <= 0:
+            # Unknown length: take the first frame of each second from the start of the clip
+            next_time = 0.0
+            yielded = 0
+            for count, frame in enumerate(container.decode(stream)):
+                if count >= MAX_SCANNED_FRAMES or yielded >= CANDIDATE_FRAMES:
+                    break
+                seconds = frame.time or 0.0
+                if seconds >= next_time:
+                    yield seconds, _shrink(frame.to_image())
+                    yielded += 1
+                    next_time = seconds + 1.0
+            return
+
+        for index in range(CANDIDATE_FRAMES):
+            target = duration * index / CANDIDATE_FRAMES
+            container.seek(int(target / stream.time_base), stream=stream, backward=True)
+            chosen = None
+            for count, frame in enumerate(container.decode(stream)):
+                chosen = frame
+                if (frame.time or 0.0) >= target or count >= MAX_DECODE_PER_SEEK:
+                    break
+            if chosen is not None:
+                yield chosen.time or target, _shrink(chosen.to_image())
+
+
+def select_key_frames(candidates):
+    """Drops near-duplicate frames and returns at most MAX_KEY_FRAMES of the rest, in order.
+
+    Returns (key frames as (seconds, image) pairs, frames considered, duplicates dropped).
+    """
+    kept = []
+    considered = 0
+    last_hash = None
+    for seconds, frame in candidates:
+        considered += 1
+        frame_hash = dhash(frame)
+        if last_hash is not None and hamming(frame_hash, last_hash) <= DUPLICATE_DISTANCE:
+            continue
+        last_hash = frame_hash
+        kept.append((seconds, frame))
+
+    dropped = considered - len(kept)
+    if len(kept) > MAX_KEY_FRAMES:
+        # Spread the frames we keep evenly over the clip, always including the first and last
+        last = len(kept) - 1
+        indexes = sorted({round(i * last / (MAX_KEY_FRAMES - 1)) for i in range(MAX_KEY_FRAMES)})
+        kept = [kept[i] for i in indexes]
+    return kept, considered, dropped
+
+def encode_frame(img: Image.Image) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=KEY_FRAME_JPEG_QUALITY)
+    return output.getvalue()
+
+
+def extract_key_frames(data: bytes, is_video: bool):
+    """Decodes an animation or video lazily and returns (key frames, report line)."""
+    if is_video:
+        candidates = iter_video_frames(data)
+    else:
+        img = Image.open(io.BytesIO(data))
+        candidates = iter_image_frames(img)
+
+    key_frames, considered, dropped = select_key_frames(candidates)
+    report = (
+        f"Route: key frames ({len(key_frames)} sent of {considered} sampled, "
+        f"{dropped} near-duplicates dropped)"
+    )
+    return key_frames, report
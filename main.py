@@ -4,7 +4,9 @@ import os
 import asyncio
 import time
 import logging
-from config import DISCORD_BOT_TOKEN, OWNER_ID, OWNER_IDS
+import aiohttp
+from config import DISCORD_BOT_TOKEN, OWNER_ID, OWNER_IDS, MEMORY_BUDGET_MB, KEEPALIVE_SECONDS
+from memory_budget import MemoryGovernor
 import utils
 
 # --- Logging Setup ---
@@ -26,21 +28,32 @@ intents.messages = True
 intents.guilds = True
 
 def get_prefix(bot, message):
-    return utils.get_setting("prefix")
+    # Resolved from the in-memory settings index, no disk access per message
+    return utils.get_setting_for(message, "prefix")
 
 # Subclassing Bot to use setup_hook
 class GeminiBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix=get_prefix, intents=intents, owner_ids=OWNER_IDS)
         self.start_time = None
+        # Shared by every cog that downloads or decodes images
+        self.memory_governor = MemoryGovernor(MEMORY_BUDGET_MB * 1024 * 1024)
+        self.http_session = None
 
     async def setup_hook(self):
+        # One shared session so image downloads reuse warm connections to the Discord CDN
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(keepalive_timeout=KEEPALIVE_SECONDS)
+        )
+
         # Load cogs here to ensure it only happens once
         initial_extensions = [
             'cogs.general',
             'cogs.gemini',
             'cogs.admin',
-            'cogs.ocr'
+            'cogs.ocr',
+            'cogs.backfill',
+            'cogs.keepalive'  # Last, so it can warm up the cogs loaded before it
         ]
         for extension in initial_extensions:
             try:
@@ -49,6 +62,11 @@ class GeminiBot(commands.Bot):
             except Exception as e:
                 await handle_error(f"Failed to load cog {extension}: {e}")
 
+    async def close(self):
+        await super().close()
+        if self.http_session:
+            await self.http_session.close()
+
 # Initialize the bot
 bot = GeminiBot()
 
@@ -107,6 +125,8 @@ async def on_command_error(ctx, error):
         await ctx.send("You don't have the necessary permissions to use this command.")
     elif isinstance(error, commands.BotMissingPermissions):
         await ctx.send("I don't have the necessary permissions to execute this command.")
+    elif isinstance(error, commands.CommandOnCooldown):
+        await ctx.send(f"You're using this command too often. Please try again in {error.retry_after:.0f} seconds.")
     elif isinstance(error, commands.NotOwner):
         await ctx.send("This command can only be used by the bot owner.")
     elif isinstance(error, commands.CheckFailure):
@@ -0,0 +1,204 @@
+import asyncio
+import io
+from collections import deque
+from PIL import Image
+
+# How much of a download we read before deciding whether to admit it.
+# Enough for the header of every format Pillow can identify in practice.
+HEADER_PROBE_BYTES = 64 * 1024
+
+# Used when the header can't be parsed (PDFs, truncated headers, unknown formats):
+# roughly a 12 megapixel photo held as RGBA.
+FALLBACK_FRAME_BYTES = 4000 * 3000 * 4
+
+# Body size admitted for responses that don't send Content-Length
+UNKNOWN_LENGTH_BYTES = 25 * 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a download can never fit in the memory budget."""
+
+
+def bytes_per_pixel(mode: str) -> int:
+    """How many bytes Pillow uses per pixel in memory for an image mode."""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    # RGB, RGBA, CMYK, LA, I, F and friends are all stored as 32-bit pixels
+    return 4
+
+def estimate_frame_bytes(header: bytes):
+    """Estimates the decoded size of one frame from the start of an image file.
+
+    Only the header is parsed; no pixels are decoded. Returns None if the
+    header isn't recognised.
+    """
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            width, height = img.size
+            return width * height * bytes_per_pixel(img.mode)
+    except Exception:
+        return None
+
+
+class Lease:
+    """A chunk of the memory budget held by one request. Release it when done."""
+
+    def __init__(self, governor, nbytes: int, frame_bytes: int = 0):
+        self.governor = governor
+        self.nbytes = nbytes
+        self.frame_bytes = frame_bytes
+        self.released = False
+
+    def grow(self, extra: int):
+        """Adds to this lease without waiting.
+
+        Growing never blocks, so two requests holding the budget can't deadlock
+        waiting on each other; the overdraft only delays new admissions.
+        """
+        if extra <= 0 or self.released:
+            return
+        self.nbytes += extra
+        self.governor.in_use += extra
+        self.governor.peak = max(self.governor.peak, self.governor.in_use)
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.governor._release(self.nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class MemoryGovernor:
+    """Admits image work against a global budget of in-flight bytes.
+
+    Requests are admitted in arrival order, so a large image isn't starved by a
+    stream of small ones. A single request larger than the whole budget is
+    admitted on its own once everything else has finished.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        self.in_use = 0
+        self.peak = 0
+        self._waiters = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + nbytes <= self.budget
+
+    async def acquire(self, nbytes: int, frame_bytes: int = 0) -> Lease:
+        """Waits until `nbytes` fit in the budget and returns a lease for them.
+
+        Raises MemoryBudgetExceeded if `nbytes` is larger than the whole budget.
+        """
+        if nbytes > self.budget:
+            raise MemoryBudgetExceeded(self._too_large_message(nbytes))
+        if not self._waiters and self._fits(nbytes):
+            self.in_use += nbytes
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = (nbytes, future)
+            self._waiters.append(entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    self._wake_waiters()
+                elif future.done() and not future.cancelled():
+                    # We were admitted just as we got cancelled; give the bytes back
+                    self._release(nbytes)
+                raise
+        self.peak = max(self.peak, self.in_use)
+        return Lease(self, nbytes, frame_bytes)
+
+    def _release(self, nbytes: int):
+        self.in_use = max(0, self.in_use - nbytes)
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters:
+            nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self.in_use += nbytes
+            future.set_result(None)
+
+    def _too_large_message(self, nbytes: int) -> str:
+        mb = 1024 * 1024
+        return f"That file is too large to process (about {nbytes / mb:.0f}MB needed, limit {self.budget / mb:.0f}MB)."
+
+    async def read_response(self, resp, working_copies: int = 2):
+        """Reads an aiohttp response body once the budget allows it.
+
+        The cost is estimated before the body is downloaded, from
+        `Content-Length` plus the image header (width x height x mode) times the
+        number of decoded copies the caller expects to hold at once. Responses
+        that can never fit are rejected up front, and the body is read in chunks
+        and abandoned as soon as it grows past the size that was admitted.
+        Returns `(lease, body)`; the caller must release the lease.
+        """
+        if resp.content_length is not None and resp.content_length > self.budget:
+            raise MemoryBudgetExceeded(self._too_large_message(resp.content_length))
+
+        header = b""
+        while len(header) < HEADER_PROBE_BYTES:
+            chunk = await resp.content.read(HEADER_PROBE_BYTES - len(header))
+            if not chunk:
+                break
+            header += chunk
+
+        if resp.content_length is not None:
+            max_body = resp.content_length
+        elif len(header) < HEADER_PROBE_BYTES:
+            # The whole body already fit in the probe
+            max_body = len(header)
+        else:
+            max_body = min(UNKNOWN_LENGTH_BYTES, self.budget)
+
+        frame_bytes = estimate_frame_bytes(header)
+        if frame_bytes is not None:
+            cost = max_body + frame_bytes * working_copies
+        else:
+            # Only a guess, so don't reject the download over it
+            frame_bytes = FALLBACK_FRAME_BYTES
+            cost = min(max_body + frame_bytes * working_copies, self.budget)
+        lease = await self.acquire(cost, frame_bytes)
+
+        try:
+            body = bytearray(header)
+            if len(body) > max_body:
+                raise MemoryBudgetExceeded("The download is larger than its Content-Length.")
+            async for chunk in resp.content.iter_chunked(READ_CHUNK_BYTES):
+                body += chunk
+                if len(body) > max_body:
+                    # Content-Length was wrong, or there wasn't one and the body is too big
+                    raise MemoryBudgetExceeded(self._too_large_message(len(body)))
+        except BaseException:
+            lease.release()
+            raise
+        return lease, bytes(body)
+
+    def status(self) -> str:
+        """A short human-readable summary for `ping`."""
+        mb = 1024 * 1024
+        return (
+            f"{self.in_use / mb:.1f}MB / {self.budget / mb:.0f}MB in use "
+            f"(peak {self.peak / mb:.1f}MB), {self.waiting} waiting"
+        )
@@ -0,0 +1,124 @@
+import io
+import logging
+from PIL import Image
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+# The probe runs Tesseract on a copy no larger than this, which keeps it well
+# under a second while still reading normal screenshot-sized text.
+PROBE_MAX_SIDE = 1600
+# Words below this confidence are treated as noise (photos often produce some)
+MIN_WORD_CONFIDENCE = 60
+# An image counts as text-dominant when recognised words cover this much of it...
+TEXT_COVERAGE_THRESHOLD = 0.12
+# ...and there are at least this many of them
+MIN_WORDS = 25
+# Size of the image sent alongside the OCR text for text-dominant images
+HYBRID_IMAGE_MAX_SIDE = 768
+
+ROUTE_FULL = "full"
+ROUTE_HYBRID = "hybrid"
+ROUTE_OCR = "ocr"
+
+
+class RouteDecision:
+    """The outcome of the text-density probe for one image."""
+
+    def __init__(self, route, coverage=0.0, words=0, text="", reason=""):
+        self.route = route
+        self.coverage = coverage
+        self.words = words
+        self.text = text
+        self.reason = reason
+
+    def report(self) -> str:
+        """One line describing the routing, suitable for showing to the user."""
+        stats = f"{self.coverage:.0%} text coverage, {self.words} words"
+        if self.route == ROUTE_HYBRID:
+            return f"Route: hybrid ({stats}; sent OCR text with a {HYBRID_IMAGE_MAX_SIDE}px image)"
+        if self.route == ROUTE_OCR:
+            return f"Route: OCR only ({self.words} words from a full-resolution pass; Gemini was not used)"
+        return f"Route: full image ({self.reason or stats})"
+
+
+def _text_from_data(data) -> str:
+    """Rebuilds readable text from `image_to_data` output, keeping lines and paragraphs."""
+    lines = []
+    current_key = None
+    current_par = None
+    for index, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][index]) < MIN_WORD_CONFIDENCE:
+            continue
+        par = (data["block_num"][index], data["par_num"][index])
+        key = par + (data["line_num"][index],)
+        if key != current_key:
+            if current_par is not None and par != current_par:
+                lines.append("")
+            lines.append(word)
+            current_key = key
+            current_par = par
+        else:
+            lines[-1] += " " + word
+    return "\n".join(lines)
+
+
+def probe_text(img: Image.Image, lang: str = None) -> RouteDecision:
+    """Runs a single Tesseract pass over a reduced copy of the image.
+
+    Returns a decision with the word coverage, word count and recognised text.
+    The route is left undecided; see `decide_route`.
+    """
+    probe = img.convert("L")
+    probe.thumbnail((PROBE_MAX_SIDE, PROBE_MAX_SIDE))
+    data = pytesseract.image_to_data(probe, lang=lang, output_type=pytesseract.Output.DICT)
+
+    covered = 0
+    words = 0
+    for index, word in enumerate(data["text"]):
+        if word.strip() and float(data["conf"][index]) >= MIN_WORD_CONFIDENCE:
+            covered += data["width"][index] * data["height"][index]
+            words += 1
+
+    coverage = covered / max(1, probe.width * probe.height)
+    return RouteDecision(None, coverage=coverage, words=words, text=_text_from_data(data))
+
+
+def read_text(img: Image.Image, lang: str = None) -> RouteDecision:
+    """Reads the full-resolution image with Tesseract, as the `ocr` command does.
+
+    Used when only the text is wanted; the probe's reduced, confidence-filtered
+    text would drop small or faint words.
+    """
+    text = pytesseract.image_to_string(img, lang=lang)
+    return RouteDecision(ROUTE_OCR, words=len(text.split()), text=text)
+
+
+def decide_route(img: Image.Image, ocr_only: bool = False, lang: str = None) -> RouteDecision:
+    """Decides whether an image should go to Gemini in full, as OCR text plus a small image, or not at all."""
+    try:
+        if ocr_only:
+            return read_text(img, lang)
+        decision = probe_text(img, lang)
+    except pytesseract.TesseractNotFoundError:
+        return RouteDecision(ROUTE_FULL, reason="Tesseract is not installed")
+    except Exception as e:
+        # The probe is only an optimisation; a bad language, a Tesseract crash or
+        # an unusual image mode must never stop the image from being described
+        logger.warning(f"Text probe failed, sending the full image: {e}")
+        return RouteDecision(ROUTE_FULL, reason="text probe failed")
+
+    if decision.coverage >= TEXT_COVERAGE_THRESHOLD and decision.words >= MIN_WORDS:
+        decision.route = ROUTE_HYBRID
+    else:
+        decision.route = ROUTE_FULL
+    return decision
+
+
+def shrink_for_hybrid(img: Image.Image) -> bytes:
+    """Returns a PNG of the image reduced to `HYBRID_IMAGE_MAX_SIDE` on its longest side."""
+    small = img.convert("RGB")
+    small.thumbnail((HYBRID_IMAGE_MAX_SIDE, HYBRID_IMAGE_MAX_SIDE))
+    output = io.BytesIO()
+    small.save(output, format="PNG", optimize=True)
+    return output.getvalue()
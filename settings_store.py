@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+
+SCOPE_GLOBAL = "global"
+SCOPE_GUILD = "guild"
+SCOPE_CHANNEL = "channel"
+
+
+class SettingsStore:
+    """Global, per-guild and per-channel settings kept in SQLite.
+
+    Every row is also held in an in-memory index, so lookups never touch the
+    database: resolving a key is at most three dictionary lookups
+    (channel, then guild, then global). Writes go to SQLite first, in a
+    transaction, and only then update the index.
+    """
+
+    def __init__(self, path: str, defaults: dict):
+        self.path = path
+        self.defaults = defaults
+        self._conn = sqlite3.connect(path)
+        # WAL keeps readers and the single writer from blocking each other,
+        # and a crash mid-write can't leave a half-written settings file behind
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            "scope TEXT NOT NULL, scope_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (scope, scope_id, key))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+        self._global = {}
+        self._guilds = {}
+        self._channels = {}
+        self._load_index()
+
+    def _index_for(self, scope: str):
+        if scope == SCOPE_GUILD:
+            return self._guilds
+        if scope == SCOPE_CHANNEL:
+            return self._channels
+        return None
+
+    def _load_index(self):
+        for scope, scope_id, key, value in self._conn.execute("SELECT scope, scope_id, key, value FROM settings"):
+            value = json.loads(value)
+            if scope == SCOPE_GLOBAL:
+                self._global[key] = value
+            else:
+                self._index_for(scope).setdefault(scope_id, {})[key] = value
+
+    def migrate_json(self, json_path: str):
+        """Imports a legacy settings.json into the global scope, once."""
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"Error migrating {json_path}: {e}")
+                return
+            with self._conn:
+                for key, value in data.items():
+                    self._write(SCOPE_GLOBAL, 0, key, value)
+            self._global.update(data)
+            print(f"Migrated {len(data)} settings from {json_path} to {self.path}.")
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', '1')")
+
+    def _write(self, scope: str, scope_id: int, key: str, value):
+        self._conn.execute(
+            "INSERT INTO settings (scope, scope_id, key, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (scope, scope_id, key) DO UPDATE SET value = excluded.value",
+            (scope, scope_id, key, json.dumps(value))
+        )
+
+    def get(self, key: str, guild_id: int = None, channel_id: int = None):
+        """Resolves a key: channel override, then guild override, then global, then the default."""
+        if channel_id is not None:
+            overrides = self._channels.get(channel_id)
+            if overrides and key in overrides:
+                return overrides[key]
+        if guild_id is not None:
+            overrides = self._guilds.get(guild_id)
+            if overrides and key in overrides:
+                return overrides[key]
+        if key in self._global:
+            return self._global[key]
+        return self.defaults.get(key)
+
+    def source(self, key: str, guild_id: int = None, channel_id: int = None):
+        """Returns (scope, scope_id) of the level that `get` would resolve the key from."""
+        if channel_id is not None and key in self._channels.get(channel_id, {}):
+            return SCOPE_CHANNEL, channel_id
+        if guild_id is not None and key in self._guilds.get(guild_id, {}):
+            return SCOPE_GUILD, guild_id
+        return SCOPE_GLOBAL, 0
+
+    def get_global(self) -> dict:
+        """Returns the global settings merged over the defaults."""
+        settings = dict(self.defaults)
+        settings.update(self._global)
+        return settings
+
+    def set(self, key: str, value, scope: str = SCOPE_GLOBAL, scope_id: int = 0):
+        with self._conn:
+            self._write(scope, scope_id, key, value)
+        if scope == SCOPE_GLOBAL:
+            self._global[key] = value
+        else:
+            self._index_for(scope).setdefault(scope_id, {})[key] = value
+
+    def clear(self, key: str, scope: str, scope_id: int):
+        """Removes an override so the next scope up applies again."""
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM settings WHERE scope = ? AND scope_id = ? AND key = ?",
+                (scope, scope_id, key)
+            )
+        if scope == SCOPE_GLOBAL:
+            self._global.pop(key, None)
+            return
+        index = self._index_for(scope)
+        overrides = index.get(scope_id)
+        if overrides is not None:
+            overrides.pop(key, None)
+            if not overrides:
+                del index[scope_id]
+
+    def overrides(self, scope: str, scope_id: int) -> dict:
+        index = self._index_for(scope)
+        return dict(index.get(scope_id, {})) if index is not None else dict(self._global)
@@ -1,71 +1,203 @@
-import json
-import os
+import time
+from collections import OrderedDict
+import discord
+from discord.ext import commands
+from settings_store import SettingsStore, SCOPE_GLOBAL, SCOPE_GUILD, SCOPE_CHANNEL
 
-SETTINGS_FILE = "settings.json"
+SETTINGS_FILE = "settings.json"  # Legacy file, imported into SETTINGS_DB on first run
+SETTINGS_DB = "settings.db"
 
 DEFAULT_SETTINGS = {
     "prefix": "alii!",
     "error_log_channel_id": None,
     "error_log_dm": False,
-    "auto_update": True
+    "auto_update": True,
+    "default_model": "gemini-3-flash-preview",
+    "ocr_language": "eng",
+    "rate_limit": 0  # Image commands (describe, ask and ocr combined) per user per minute, 0 for unlimited
 }
 
+# Settings that server managers can override for their guild or a channel
+SCOPED_SETTINGS = ("prefix", "default_model", "ocr_language", "rate_limit")
+
+_store = None
+
+def get_store() -> SettingsStore:
+    """Returns the shared settings store, opening (and migrating) it on first use."""
+    global _store
+    if _store is None:
+        _store = SettingsStore(SETTINGS_DB, DEFAULT_SETTINGS)
+        _store.migrate_json(SETTINGS_FILE)
+    return _store
+
+def scope_ids(source):
+    """Returns (guild_id, channel_id) for a message or context. Threads use their parent channel."""
+    guild = source.guild
+    channel = source.channel
+    if isinstance(channel, discord.Thread):
+        channel_id = channel.parent_id
+    else:
+        channel_id = channel.id if channel is not None else None
+    return (guild.id if guild else None), channel_id
+
 def load_settings():
-    """Loads settings from the JSON file. Returns defaults if file is missing/corrupt."""
-    if not os.path.exists(SETTINGS_FILE):
-        save_settings(DEFAULT_SETTINGS)
-        return DEFAULT_SETTINGS
-    
-    try:
-        with open(SETTINGS_FILE, 'r') as f:
-            data = json.load(f)
-            # Ensure all keys exist (merge with defaults)
-            for key, value in DEFAULT_SETTINGS.items():
-                if key not in data:
-                    data[key] = value
-            return data
-    except Exception as e:
-        print(f"Error loading settings: {e}")
-        return DEFAULT_SETTINGS
+    """Returns the global settings, merged with defaults."""
+    return get_store().get_global()
 
 def save_settings(settings):
-    """Saves the settings dictionary to the JSON file."""
-    try:
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings, f, indent=4)
-    except Exception as e:
-        print(f"Error saving settings: {e}")
-
-def get_setting(key):
-    """Helper to get a single setting."""
-    settings = load_settings()
-    return settings.get(key, DEFAULT_SETTINGS.get(key))
-
-def update_setting(key, value):
-    """Helper to update a single setting."""
-    settings = load_settings()
-    settings[key] = value
-    save_settings(settings)
+    """Saves every key in the dictionary as a global setting."""
+    for key, value in settings.items():
+        update_setting(key, value)
 
-async def send_long_message(ctx, message: str):
-    """Sends a message in chunks if it exceeds Discord's 2000 character limit."""
-    if len(message) <= 2000:
-        await ctx.send(message)
-        return
+def get_setting(key, guild_id=None, channel_id=None):
+    """Helper to get a single setting. Channel overrides win over guild overrides, which win over global."""
+    return get_store().get(key, guild_id, channel_id)
 
-    # Split by lines first to preserve formatting where possible
-    lines = message.split('\n')
+def get_setting_for(source, key):
+    """Helper to get a setting as it applies to a message or context."""
+    guild_id, channel_id = scope_ids(source)
+    return get_store().get(key, guild_id, channel_id)
+
+def update_setting(key, value, guild_id=None, channel_id=None):
+    """Helper to update a single setting, globally or for one guild/channel."""
+    store = get_store()
+    if channel_id is not None:
+        store.set(key, value, SCOPE_CHANNEL, channel_id)
+    elif guild_id is not None:
+        store.set(key, value, SCOPE_GUILD, guild_id)
+    else:
+        store.set(key, value, SCOPE_GLOBAL, 0)
+
+def clear_setting(key, guild_id=None, channel_id=None):
+    """Helper to remove a guild or channel override."""
+    store = get_store()
+    if channel_id is not None:
+        store.clear(key, SCOPE_CHANNEL, channel_id)
+    elif guild_id is not None:
+        store.clear(key, SCOPE_GUILD, guild_id)
+
+def rate_limit_cooldown(message):
+    """Dynamic cooldown for image commands, using the `rate_limit` setting for where the message was sent."""
+    rate = get_setting_for(message, "rate_limit")
+    if not rate:
+        return None
+    return commands.Cooldown(rate, 60)
+
+def rate_limit_key(message):
+    """Cooldown bucket key: the user, the scope their `rate_limit` comes from, and its value.
+
+    A user limited in one channel is not limited in another channel with its own
+    setting, and a changed limit starts a fresh bucket instead of waiting for the old one.
+    """
+    guild_id, channel_id = scope_ids(message)
+    store = get_store()
+    return message.author.id, store.source("rate_limit", guild_id, channel_id), store.get("rate_limit", guild_id, channel_id)
+
+# One mapping for every image command, so `rate_limit` counts them together
+IMAGE_COOLDOWNS = commands.DynamicCooldownMapping(rate_limit_cooldown, rate_limit_key)
+
+async def image_rate_limit(cog, ctx):
+    """Before-invoke hook for image commands in cogs: `@commands.before_invoke(utils.image_rate_limit)`."""
+    retry_after = IMAGE_COOLDOWNS.update_rate_limit(ctx.message)
+    if retry_after:
+        raise commands.CommandOnCooldown(IMAGE_COOLDOWNS.get_bucket(ctx.message), retry_after, commands.BucketType.user)
+
+class TTLCache:
+    """A size-bounded dictionary whose entries expire after `ttl` seconds.
+
+    The least recently used entry is dropped once `max_size` is reached.
+    `on_evict(key, value)` is called whenever an entry expires, is pushed out,
+    or is overwritten with a different value.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 1800, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+
+    def _evicted(self, key, value):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        # Entries are kept in insertion/access order, so the oldest are at the front
+        while self._data:
+            key, (expires_at, value) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+            self._evicted(key, value)
+
+    def get(self, key, default=None):
+        self._evict_expired()
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        # Refresh the entry on access so active conversations stay alive
+        self._data[key] = (time.monotonic() + self.ttl, entry[1])
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self._evict_expired()
+        previous = self._data.get(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if previous is not None and previous[1] is not value:
+            self._evicted(key, previous[1])
+        while len(self._data) > self.max_size:
+            old_key, (_, old_value) = self._data.popitem(last=False)
+            self._evicted(old_key, old_value)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def values(self):
+        """Returns the stored values, including any that have expired but not been evicted yet."""
+        return [value for _, value in self._data.values()]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        self._evict_expired()
+        return len(self._data)
+
+def split_message(message: str, limit: int = 2000):
+    """Splits a message into chunks under Discord's character limit, breaking on lines where possible."""
+    if len(message) <= limit:
+        return [message]
+
+    chunks = []
     current_chunk = ""
-    
-    for line in lines:
-        if len(current_chunk) + len(line) + 1 > 2000:
-            # Current chunk is full, send it
+    # Split by lines first to preserve formatting where possible
+    for line in message.split('\n'):
+        # A single line longer than the limit has to be cut mid-line
+        while len(line) + 1 > limit:
+            if current_chunk.strip():
+                chunks.append(current_chunk)
+            current_chunk = ""
+            chunks.append(line[:limit - 1])
+            line = line[limit - 1:]
+        if len(current_chunk) + len(line) + 1 > limit:
+            # Current chunk is full, start a new one
             if current_chunk.strip():
-                await ctx.send(current_chunk)
+                chunks.append(current_chunk)
             current_chunk = line + "\n"
         else:
             current_chunk += line + "\n"
-            
-    # Send any remaining content
+
+    # Keep any remaining content
     if current_chunk.strip():
-        await ctx.send(current_chunk)
+        chunks.append(current_chunk)
+    return chunks
+
+async def send_long_message(ctx, message: str):
+    """Sends a message in chunks if it exceeds Discord's 2000 character limit.
+
+    Returns the list of messages that were sent.
+    """
+    return [await ctx.send(chunk) for chunk in split_message(message)]